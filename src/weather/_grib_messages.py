@@ -0,0 +1,110 @@
+# Shared GRIB message scanner: slices messages out of a mapped file by their section-0 length
+import contextlib
+import mmap
+import os
+import sys
+
+# Silence ecCodes logging/debug BEFORE importing eccodes
+os.environ.setdefault('ECCODES_LOG_STREAM', os.devnull)
+
+from eccodes import codes_get, codes_grib_new_from_file, codes_release
+
+# shared stderr sink for noisy library messages
+_DEVNULL = open(os.devnull, 'w')
+
+
+def silence_stderr() -> None:
+    """Point fd 2 (where ecCodes' C library logs) and sys.stderr at /dev/null for the whole process.
+    Used as a worker initializer: errors still reach the parent as pickled exceptions.
+    """
+    os.dup2(_DEVNULL.fileno(), 2)
+    sys.stderr = _DEVNULL
+
+
+@contextlib.contextmanager
+def silenced_stderr():
+    """Like silence_stderr, but only for the with-block; the real stderr is back before any traceback prints."""
+    sys.stderr.flush()
+    saved = os.dup(2)
+    try:
+        os.dup2(_DEVNULL.fileno(), 2)
+        with contextlib.redirect_stderr(_DEVNULL):
+            yield
+    finally:
+        os.dup2(saved, 2)
+        os.close(saved)
+
+
+def message_length(mm, off: int, fd: int) -> int:
+    """Total length of the GRIB message at ``off`` in ``mm`` (a mapping of ``fd``), 0 if unknown.
+    Read from section 0 without decoding the message.
+    """
+    edition = mm[off + 7] if off + 8 <= len(mm) else 0
+    if edition == 2:
+        # GRIB2: big-endian uint64 at bytes 8..15
+        return int.from_bytes(mm[off + 8:off + 16], 'big')
+    if edition == 1:
+        # GRIB1: big-endian uint24 at bytes 4..6; the top bit flags a >8 MB message whose
+        # real length is encoded further in, so only that rare case goes through ecCodes,
+        # which reads just this message from the file rather than a copy of the mapping
+        length = int.from_bytes(mm[off + 4:off + 7], 'big')
+        if not length & 0x800000:
+            return length
+        with silenced_stderr(), open(fd, 'rb', buffering=0, closefd=False) as raw:
+            raw.seek(off)
+            gid = codes_grib_new_from_file(raw)
+        if gid is None:
+            return 0
+        try:
+            return codes_get(gid, 'totalLength')
+        finally:
+            codes_release(gid)
+    return 0
+
+
+def iter_spans(mm, fd: int):
+    """Yield (start, end) of every GRIB message in ``mm``, a mapping of ``fd``, without copying any bytes."""
+    off = mm.find(b'GRIB')
+    while off != -1:
+        end = off + message_length(mm, off, fd)
+        if off < end <= len(mm) and mm[end - 4:end] == b'7777':
+            yield off, end
+            off = mm.find(b'GRIB', end)
+        else:
+            # stray 'GRIB' bytes or a truncated message: resync on the next magic, like ecCodes
+            off = mm.find(b'GRIB', off + 4)
+
+
+def iter_messages(fin, start: int = 0):
+    """Yield the raw bytes of every GRIB message in an open file, one at a time, from index ``start`` on.
+    The file is mapped once and each message sliced out by its section-0 length, instead of
+    ecCodes reading it message by message through stdio; skipped messages are never copied.
+    """
+    fd = fin.fileno()
+    if os.fstat(fd).st_size == 0:
+        return
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+        for index, (off, end) in enumerate(iter_spans(mm, fd)):
+            if index >= start:
+                yield mm[off:end]
+
+
+def _get(gid, key, default=None):
+    try:
+        return codes_get(gid, key)
+    except Exception:
+        return default
+
+
+def scan(path, keys):
+    """One dict of header keys per message, ``None`` where a message lacks a key (e.g. Ni/Nj on a
+    spherical-harmonics field); only header keys are read, the data section is never decoded.
+    """
+    messages = []
+    with open(path, "rb") as f:
+        while (gid := codes_grib_new_from_file(f)) is not None:
+            try:
+                messages.append({k: _get(gid, k) for k in keys})
+            finally:
+                codes_release(gid)
+    return messages
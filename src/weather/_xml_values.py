@@ -0,0 +1,76 @@
+# Shared reader for the <values> node of the per-message XML dumps (reconstruct_xml.py, tools/)
+import base64
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from lxml import etree as ET  # optional: libxml2 parser, several times faster than ElementTree
+    # values text routinely exceeds libxml2's default 10 MB text-node limit
+    _XML_PARSER = ET.XMLParser(huge_tree=True)
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _XML_PARSER = None
+
+
+def parse_xml(xml_path):
+    """Parse an XML dump and return its root element."""
+    return ET.parse(str(xml_path), _XML_PARSER).getroot()
+
+
+def fromstring_numbers(text: str, dtype=np.float64):
+    """Parse whitespace/comma separated numbers in C ('--' marks missing); None if any token is malformed."""
+    with warnings.catch_warnings():
+        # older NumPy only warns (and truncates) on unparsable text; newer raises ValueError
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text.replace(',', ' ').replace('--', 'nan'), dtype=dtype, sep=' ')
+        except (DeprecationWarning, ValueError):
+            return None
+
+
+def find_values(root, xml_path):
+    """The <values> node of a <gribMessage> or legacy <grib><variable> document."""
+    # avoid truthiness deprecation on Element
+    vnode = root.find('data/values')
+    if vnode is None:
+        vnode = root.find('.//values')
+    if vnode is None:
+        raise ValueError(f"Could not find <values> in {xml_path}")
+    return vnode
+
+
+def values_from_node(vnode, xml_path):
+    """Decode a <values> node into a fresh, writable float64 array (NaN marks missing)."""
+    text = (vnode.text or '').strip()
+    if vnode.get('encoding') == 'base64':
+        # Binary dump (convert_grb.py --binary): little-endian IEEE floats, NaN marks missing
+        dtype = np.dtype(vnode.get('dtype', 'float64')).newbyteorder('<')
+        values = np.frombuffer(base64.b64decode(text), dtype=dtype).astype(np.float64)
+    elif vnode.get('encoding') == 'npy':
+        # Sidecar dump (convert_grb.py --sidecar): .npy next to the XML, NaN marks missing
+        values = np.load(Path(xml_path).parent / vnode.get('href')).astype(np.float64)
+    else:
+        count = None
+        if not text:
+            # legacy <value> children: join once (empty -> missing) and parse like the text form
+            toks = [(child.text or '').strip() for child in vnode if isinstance(child.tag, str) and child.tag.lower() == 'value']
+            text = ' '.join(t or 'nan' for t in toks)
+            count = len(toks)
+        # one C-level ASCII -> float64 pass; '--', 'NaN' and 'nan' all become NaN
+        values = fromstring_numbers(text)
+        if values is None or (count is not None and values.size != count):
+            raise ValueError(f"Unparsable <values> in {xml_path}")
+    if vnode.get('encoding') is None and vnode.get('dtype') == 'float32':
+        # '.9g' text identifies a float32 exactly; narrow back to it before widening
+        values = values.astype(np.float32).astype(np.float64)
+    return values
+
+
+def read_values(xml_path, count=None):
+    """Read the values of one XML dump as float64; with count, raise ValueError on a size mismatch."""
+    values = values_from_node(find_values(parse_xml(xml_path), xml_path), xml_path)
+    if count is not None and values.size != count:
+        raise ValueError(f"{xml_path}: expected {count} values, found {values.size}")
+    return values
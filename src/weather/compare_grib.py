@@ -2,8 +2,8 @@
 import os
 os.environ.setdefault('ECCODES_LOG_STREAM', os.devnull)
 
-import pygrib
 import numpy as np
+from eccodes import *  # noqa: F401,F403
 from pathlib import Path
 
 
@@ -11,59 +11,77 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / 'data'
 
+def _get(gid, key, default=None):
+    try:
+        return codes_get(gid, key)
+    except Exception:
+        return default
+
+def _values(gid):
+    """Decoded values as float64, with bitmap-missing points set to NaN."""
+    values = codes_get_values(gid)
+    if _get(gid, 'bitmapPresent') == 1:
+        values[values == _get(gid, 'missingValue')] = np.nan
+    return values
+
 def compare_grib_files(original_path, reconstructed_path):
-    orig_grbs = pygrib.open(str(original_path))
-    recon_grbs = pygrib.open(str(reconstructed_path))
-    
-    orig_messages = list(orig_grbs)
-    recon_messages = list(recon_grbs)
-    
-    orig_grbs.close()
-    recon_grbs.close()
-    
-    if len(orig_messages) != len(recon_messages):
-        print(f"Message count mismatch: Original {len(orig_messages)}, Reconstructed {len(recon_messages)}")
-        return False
-    
-    all_match = True
-    for index, (orig_msg, recon_msg) in enumerate(zip(orig_messages, recon_messages)):
-        # Compare metadata
-        if orig_msg.name != recon_msg.name:
-            print(f"Message {index}: Name mismatch - Orig: {orig_msg.name}, Recon: {recon_msg.name}")
-            all_match = False
-        if orig_msg.validDate != recon_msg.validDate:
-            print(f"Message {index}: validDate mismatch - Orig: {orig_msg.validDate}, Recon: {recon_msg.validDate}")
-            all_match = False
-        if orig_msg.typeOfLevel != recon_msg.typeOfLevel:
-            print(f"Message {index}: typeOfLevel mismatch - Orig: {orig_msg.typeOfLevel}, Recon: {recon_msg.typeOfLevel}")
-            all_match = False
-        
-        # Compare data values (with tolerance for floating point and handling NaNs/missing)
-        orig_values = orig_msg.values
-        recon_values = recon_msg.values
-        
-        if orig_values.shape != recon_values.shape:
-            print(f"Message {index}: Values shape mismatch - Orig: {orig_values.shape}, Recon: {recon_values.shape}")
-            all_match = False
-            continue
-        
-        # Mask missing values (NaNs in pygrib)
-        orig_mask = np.isnan(orig_values)
-        recon_mask = np.isnan(recon_values)
-        if not np.array_equal(orig_mask, recon_mask):
-            print(f"Message {index}: Missing value mask mismatch")
-            all_match = False
-        
-        # Compare non-missing values with relative tolerance
-        if not np.allclose(orig_values[~orig_mask], recon_values[~recon_mask], rtol=1e-5, atol=1e-8):
-            print(f"Message {index}: Data values do not match closely")
-            all_match = False
-    
+    # Stream both files pairwise so only one message per file is held in memory
+    with open(original_path, 'rb') as orig_f, open(reconstructed_path, 'rb') as recon_f:
+        orig_count = codes_count_in_file(orig_f)
+        recon_count = codes_count_in_file(recon_f)
+        if orig_count != recon_count:
+            print(f"Message count mismatch: Original {orig_count}, Reconstructed {recon_count}")
+            return False
+        orig_f.seek(0)
+        recon_f.seek(0)
+
+        all_match = True
+        for index in range(orig_count):
+            orig_gid = codes_grib_new_from_file(orig_f)
+            recon_gid = codes_grib_new_from_file(recon_f)
+            try:
+                # Compare metadata
+                orig_name, recon_name = _get(orig_gid, 'name'), _get(recon_gid, 'name')
+                if orig_name != recon_name:
+                    print(f"Message {index}: Name mismatch - Orig: {orig_name}, Recon: {recon_name}")
+                    all_match = False
+                orig_valid = (_get(orig_gid, 'validityDate'), _get(orig_gid, 'validityTime'))
+                recon_valid = (_get(recon_gid, 'validityDate'), _get(recon_gid, 'validityTime'))
+                if orig_valid != recon_valid:
+                    print(f"Message {index}: validDate mismatch - Orig: {orig_valid}, Recon: {recon_valid}")
+                    all_match = False
+                orig_tol, recon_tol = _get(orig_gid, 'typeOfLevel'), _get(recon_gid, 'typeOfLevel')
+                if orig_tol != recon_tol:
+                    print(f"Message {index}: typeOfLevel mismatch - Orig: {orig_tol}, Recon: {recon_tol}")
+                    all_match = False
+
+                # Compare data values (with tolerance for floating point and handling NaNs/missing)
+                orig_values = _values(orig_gid)
+                recon_values = _values(recon_gid)
+            finally:
+                codes_release(orig_gid)
+                codes_release(recon_gid)
+
+            if orig_values.shape != recon_values.shape:
+                print(f"Message {index}: Values shape mismatch - Orig: {orig_values.shape}, Recon: {recon_values.shape}")
+                all_match = False
+                continue
+
+            # One fused pass: values within tolerance, NaN (missing) only where both are NaN
+            close = np.isclose(orig_values, recon_values, rtol=1e-5, atol=1e-8, equal_nan=True)
+            if not close.all():
+                # Masks are only inspected on failure, to report which kind of mismatch it is
+                if not np.array_equal(np.isnan(orig_values), np.isnan(recon_values)):
+                    print(f"Message {index}: Missing value mask mismatch")
+                else:
+                    print(f"Message {index}: Data values do not match closely")
+                all_match = False
+
     if all_match:
         print("All messages match: Reconstruction is lossless in data and key metadata.")
     else:
         print("Some mismatches found: Reconstruction may have losses.")
-    
+
     return all_match
 
 # Main execution
@@ -73,9 +91,9 @@ if __name__ == "__main__":
     #    DATA_DIR / 'large_full_1deg.grb2',
     #    DATA_DIR / 'reconstructed_large.grb2'
     #)
-    
+
     # Compare small files
     compare_grib_files(
         DATA_DIR / 'small_subset_500mb.grb2',
         DATA_DIR / 'reconstructed_small.grb2'
-    )
\ No newline at end of file
+    )
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import argparse
-import contextlib
+import base64
+import collections
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Silence ecCodes logging before import
@@ -10,303 +13,404 @@ os.environ.setdefault('ECCODES_LOG_STREAM', os.devnull)
 import numpy as np
 from eccodes import *  # noqa: F401,F403
 
+try:
+    from weather._grib_messages import iter_messages
+except ImportError:  # run as a script: src/weather itself is on sys.path
+    from _grib_messages import iter_messages
+
 # Project paths
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / 'data'
 OUTPUT_XML = PROJECT_ROOT / 'output_xml'
 
 
-def dump_grib_to_xml(in_grib: Path, outdir: Path, prefix: str) -> int:
-    """Dump all GRIB messages to rich XML (values + metadata).
+def _format_values(vals: np.ndarray, fmt: str = '%.17g', per_line: int = 10000) -> str:
+    """Format values as space-separated text (default '.17g'); NaN becomes '--'.
 
-    XML schema (simplified):
-      <gribMessage version="1" index="i">
-        <ident>...</ident>
-        <geometry>...</geometry>
-        <representation>...</representation>
-        <data>
-          <bitmap>RLE</bitmap>
-          <values>v1 v2 ...</values>
-        </data>
-      </gribMessage>
+    Lines of ``per_line`` values (joined by '\n      ') come out of a single
+    np.savetxt call over the reshaped array; only a short last line is
+    formatted separately. np.savetxt is used rather than np.char.mod, which
+    still calls the Python formatter per element and measures ~2.5x slower on
+    10k-value chunks.
+    """
+    sep = '\n      '
+    n_full = vals.size // per_line * per_line
+    buf = io.StringIO()
+    if n_full:
+        np.savetxt(buf, vals[:n_full].reshape(-1, per_line), fmt=fmt, delimiter=' ', newline=sep)
+    if n_full < vals.size:
+        np.savetxt(buf, vals[None, n_full:], fmt=fmt, delimiter=' ', newline='')
+    text = buf.getvalue()
+    if n_full == vals.size:
+        text = text.removesuffix(sep)
+    return text.replace('nan', '--')
 
-    Returns number of messages written.
+
+def _write_file(path: Path, payload: bytes) -> None:
+    """Write an assembled document with raw os.write calls (no buffered-IO layer).
+
+    The payload goes to a ``.part`` file that is renamed into place, so a
+    partially written XML is never mistaken for a finished one (see --resume).
     """
-    outdir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.part')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
 
-    written = 0
-    with open(in_grib, 'rb') as fin:
-        idx = 0
-        while True:
-            with contextlib.redirect_stderr(open(os.devnull, 'w')):
-                gid = codes_grib_new_from_file(fin)
-            if gid is None:
-                break
+
+def _repr_keys(gid) -> list[tuple[str, bool]] | None:
+    """List this message's dataRepresentation keys as (name, is_array).
+
+    Walked per message: key sets and array sizes (group widths/lengths) differ between messages
+    sharing a template, so neither can be reused. Returns None when ecCodes offers no iterator.
+    """
+    it = codes_keys_iterator_new(gid, 'dataRepresentation')
+    if it is None:
+        return None
+    keys = []
+    try:
+        while codes_keys_iterator_next(it):
+            kname = codes_keys_iterator_get_name(it)
+            # Some keys can be extremely large or derived; we skip the actual data values
+            if kname in ('values',):
+                continue
             try:
-                # Values
-                vals = np.array(codes_get_values(gid), dtype=np.float64)
+                size = codes_get_size(gid, kname)
+            except Exception:
+                size = None
+            keys.append((kname, bool(size and size > 1)))
+    finally:
+        codes_keys_iterator_delete(it)
+    return keys
 
-                # Missing value and bitmap
-                try:
-                    mv = codes_get(gid, 'missingValue')
-                except Exception:
-                    mv = None
 
-                bitmap_mask = None
+def _dump_message(msg: bytes, idx: int, outdir: Path, prefix: str, binary: bool = False,
+                  sidecar: bool = False) -> None:
+    """Write one GRIB message (raw bytes) to ``<prefix>_msg_<idx>.xml``.
+
+    Runs inside a worker process, so the ecCodes handle is rebuilt from the
+    message bytes rather than shared with the parent. With ``binary`` the values
+    are written as base64 little-endian floats, float32 when exact and otherwise
+    float64 as recorded in ``dtype`` (missing points stay NaN). With
+    ``sidecar`` they go to ``<prefix>_msg_<idx>.npy`` next to the XML instead,
+    which ``<values href=...>`` points at.
+    """
+    gid = codes_new_from_message(msg)
+    try:
+        # Values
+        vals = np.asarray(codes_get_values(gid), dtype=np.float64)
+
+        # Missing value and bitmap
+        try:
+            mv = codes_get(gid, 'missingValue')
+        except Exception:
+            mv = None
+
+        bitmap_mask = None
+        try:
+            if codes_get(gid, 'bitmapPresent') == 1:
                 try:
-                    if codes_get(gid, 'bitmapPresent') == 1:
-                        try:
-                            bitmap = codes_get_array(gid, 'bitmap')
-                            bitmap_mask = np.array(bitmap, dtype=bool)
-                        except Exception:
-                            bitmap_mask = None
+                    bitmap = codes_get_array(gid, 'bitmap')
+                    bitmap_mask = np.array(bitmap, dtype=bool)
                 except Exception:
                     bitmap_mask = None
+        except Exception:
+            bitmap_mask = None
 
-                # Tokenize values, preserving missing as '--'
-                tokens = []
-                for j, v in enumerate(vals):
-                    is_miss = False
-                    if mv is not None and isinstance(mv, float) and not np.isnan(mv) and v == mv:
-                        is_miss = True
-                    if not is_miss and np.isnan(v):
-                        is_miss = True
-                    if not is_miss and bitmap_mask is not None and j < bitmap_mask.size and not bitmap_mask[j]:
-                        is_miss = True
-                    tokens.append('--' if is_miss else format(float(v), '.17g'))
-
-                # --- gather metadata keys (best-effort) ---
-                def g(key, default=None):
-                    try:
-                        return codes_get(gid, key)
-                    except Exception:
-                        return default
-
-                centre = g('centre')
-                sub_c  = g('subCentre')
-                disc   = g('discipline')
-                pcat   = g('parameterCategory')
-                pnum   = g('parameterNumber')
-                sname  = g('shortName')
-                tol    = g('typeOfLevel')
-                level  = g('level')
-                date   = g('date')
-                time_  = g('time')
-                step_t = g('stepType')
-                step_r = g('stepRange')
-
-                grid   = g('gridType')
-                Ni     = g('Ni')
-                Nj     = g('Nj')
-                la1    = g('latitudeOfFirstGridPointInDegrees')
-                lo1    = g('longitudeOfFirstGridPointInDegrees')
-                di     = g('iDirectionIncrementInDegrees')
-                dj     = g('jDirectionIncrementInDegrees')
-                scan   = g('scanningMode')
-
-                ptype  = g('packingType')
-                drt    = g('dataRepresentationTemplateNumber')
-                bpv    = g('bitsPerValue')
-                bsf    = g('binaryScaleFactor')
-                dsf    = g('decimalScaleFactor')
-                refv   = g('referenceValue')
-                mval   = g('missingValue')
-                bmppr  = g('bitmapPresent')
-
-                # Optional secondary missing value
-                try:
-                    mval2 = codes_get(gid, 'secondaryMissingValue')
-                except Exception:
-                    mval2 = None
+        # Mask missing values (NaN is written out as '--')
+        miss = np.isnan(vals)
+        if isinstance(mv, float) and not np.isnan(mv):
+            miss |= (vals == mv)
+        if bitmap_mask is not None:
+            nb = min(bitmap_mask.size, vals.size)
+            miss[:nb] |= ~bitmap_mask[:nb]
+        masked = np.where(miss, np.nan, vals)
+
+        # --- gather metadata keys (best-effort) ---
+        def g(key, default=None):
+            try:
+                return codes_get(gid, key)
+            except Exception:
+                return default
+
+        centre = g('centre')
+        sub_c  = g('subCentre')
+        disc   = g('discipline')
+        pcat   = g('parameterCategory')
+        pnum   = g('parameterNumber')
+        sname  = g('shortName')
+        tol    = g('typeOfLevel')
+        level  = g('level')
+        date   = g('date')
+        time_  = g('time')
+        step_t = g('stepType')
+        step_r = g('stepRange')
+
+        grid   = g('gridType')
+        Ni     = g('Ni')
+        Nj     = g('Nj')
+        la1    = g('latitudeOfFirstGridPointInDegrees')
+        lo1    = g('longitudeOfFirstGridPointInDegrees')
+        di     = g('iDirectionIncrementInDegrees')
+        dj     = g('jDirectionIncrementInDegrees')
+        scan   = g('scanningMode')
+
+        ptype  = g('packingType')
+        drt    = g('dataRepresentationTemplateNumber')
+        bpv    = g('bitsPerValue')
+        bsf    = g('binaryScaleFactor')
+        dsf    = g('decimalScaleFactor')
+        refv   = g('referenceValue')
+        mval   = g('missingValue')
+        bmppr  = g('bitmapPresent')
+
+        # Fields packed with <= 24 bits and no decimal scaling usually fit float32 exactly; use it
+        # (and '.9g') when lossless. A division by 10**D almost never lands on float32, so those
+        # fields skip the check, and a leading sample rejects the rest before the full pass.
+        vdtype, vfmt = 'float64', '%.17g'
+        if isinstance(bpv, int) and 0 < bpv <= 24 and not dsf:
+            head = masked[:1024]
+            if np.array_equal(head.astype(np.float32), head, equal_nan=True):
+                v32 = masked.astype(np.float32)
+                if np.array_equal(v32, masked, equal_nan=True):
+                    masked, vdtype, vfmt = v32, 'float32', '%.9g'
+
+        # Optional secondary missing value
+        try:
+            mval2 = codes_get(gid, 'secondaryMissingValue')
+        except Exception:
+            mval2 = None
 
-                # Hex encodings (big-endian IEEE-754 float32) for exact restoration
+        # Hex encodings (big-endian IEEE-754 float32) for exact restoration
+        rv_hex = None
+        if refv is not None:
+            try:
+                rv_hex = np.asarray(np.float32(refv), dtype='>f4').tobytes().hex()
+            except Exception:
                 rv_hex = None
-                if refv is not None:
-                    try:
-                        rv_hex = np.asarray(np.float32(refv), dtype='>f4').tobytes().hex()
-                    except Exception:
-                        rv_hex = None
+        mv_hex = None
+        if mval is not None:
+            try:
+                mv_hex = np.asarray(np.float32(mval), dtype='>f4').tobytes().hex()
+            except Exception:
                 mv_hex = None
-                if mval is not None:
-                    try:
-                        mv_hex = np.asarray(np.float32(mval), dtype='>f4').tobytes().hex()
-                    except Exception:
-                        mv_hex = None
+        mv2_hex = None
+        if mval2 is not None:
+            try:
+                mv2_hex = np.asarray(np.float32(mval2), dtype='>f4').tobytes().hex()
+            except Exception:
                 mv2_hex = None
-                if mval2 is not None:
-                    try:
-                        mv2_hex = np.asarray(np.float32(mval2), dtype='>f4').tobytes().hex()
-                    except Exception:
-                        mv2_hex = None
-
-                # optional bitmap RLE (P=present, M=missing)
-                rle_str = None
-                if bitmap_mask is not None:
-                    runs = []
-                    last = None
-                    count = 0
-                    for flag in bitmap_mask.tolist():
-                        cur = 'P' if flag else 'M'
-                        if last is None:
-                            last = cur; count = 1
-                        elif cur == last:
-                            count += 1
-                        else:
-                            runs.append(f"{last}{count}")
-                            last = cur; count = 1
-                    if last is not None:
-                        runs.append(f"{last}{count}")
-                    rle_str = ' '.join(runs)
-
-                # Write XML
-                xml_path = outdir / f"{prefix}_msg_{idx}.xml"
-                with open(xml_path, 'w', encoding='utf-8') as xf:
-                    xf.write('<gribMessage version="1" index="%d">\n' % idx)
-                    xf.write('  <ident>\n')
-                    if centre is not None:  xf.write(f'    <centre>{centre}</centre>\n')
-                    if sub_c is not None:   xf.write(f'    <subCentre>{sub_c}</subCentre>\n')
-                    if disc is not None:    xf.write(f'    <discipline>{disc}</discipline>\n')
-                    if pcat is not None:    xf.write(f'    <parameterCategory>{pcat}</parameterCategory>\n')
-                    if pnum is not None:    xf.write(f'    <parameterNumber>{pnum}</parameterNumber>\n')
-                    if sname is not None:   xf.write(f'    <shortName>{sname}</shortName>\n')
-                    if tol is not None:     xf.write(f'    <typeOfLevel>{tol}</typeOfLevel>\n')
-                    if level is not None:   xf.write(f'    <level>{level}</level>\n')
-                    if date is not None:
-                        hhmm = f"{time_:04d}" if isinstance(time_, int) else ''
-                        xf.write(f'    <date ymd="{date}" hhmm="{hhmm}"/>\n')
-                    if step_t is not None or step_r is not None:
-                        xf.write(f'    <step type="{step_t if step_t is not None else ""}">\n')
-                        if step_r is not None:
-                            xf.write(f'      <range>{step_r}</range>\n')
-                        xf.write('    </step>\n')
-                    xf.write('  </ident>\n')
-
-                    xf.write('  <geometry>\n')
-                    xf.write(f'    <gridType>{grid}</gridType>\n')
-                    for tag, val in (('Ni',Ni),('Nj',Nj),('latitudeOfFirstGridPointInDegrees',la1),
-                                     ('longitudeOfFirstGridPointInDegrees',lo1),
-                                     ('iDirectionIncrementInDegrees',di),('jDirectionIncrementInDegrees',dj),
-                                     ('scanningMode',scan)):
-                        if val is not None:
-                            xf.write(f'    <{tag}>{val}</{tag}>\n')
-                    xf.write('  </geometry>\n')
-
-                    xf.write('  <representation>\n')
-                    if ptype is not None:
-                        xf.write(f'    <packingType>{ptype}</packingType>\n')
-                    if drt is not None:
-                        xf.write(f'    <dataRepresentationTemplateNumber>{drt}</dataRepresentationTemplateNumber>\n')
-                    if bpv is not None:
-                        xf.write(f'    <bitsPerValue>{bpv}</bitsPerValue>\n')
-                    if bsf is not None:
-                        xf.write(f'    <binaryScaleFactor>{bsf}</binaryScaleFactor>\n')
-                    if dsf is not None:
-                        xf.write(f'    <decimalScaleFactor>{dsf}</decimalScaleFactor>\n')
-                    if refv is not None:
-                        xf.write(f'    <referenceValue>{refv}</referenceValue>\n')
-                    if rv_hex is not None:
-                        xf.write(f'    <referenceValueHex>{rv_hex}</referenceValueHex>\n')
-                    if mval is not None:
-                        xf.write(f'    <missingValue>{mval}</missingValue>\n')
-                    if mv_hex is not None:
-                        xf.write(f'    <missingValueHex>{mv_hex}</missingValueHex>\n')
-                    if mval2 is not None:
-                        xf.write(f'    <secondaryMissingValue>{mval2}</secondaryMissingValue>\n')
-                    if mv2_hex is not None:
-                        xf.write(f'    <secondaryMissingValueHex>{mv2_hex}</secondaryMissingValueHex>\n')
-                    if bmppr is not None:
-                        xf.write(f'    <bitmapPresent>{bmppr}</bitmapPresent>\n')
-
-                    # Dump all keys/arrays from the dataRepresentation namespace for exact reconstruction
-                    try:
-                        it = codes_keys_iterator_new(gid, 'dataRepresentation')
-                        if it is not None:
-                            xf.write('    <dataRepresentationKeys>\n')
-                            while codes_keys_iterator_next(it):
-                                kname = codes_keys_iterator_get_name(it)
-                                # Some keys can be extremely large or derived; we skip the actual data values
-                                if kname in ('values',):
-                                    continue
-                                try:
-                                    size = None
-                                    try:
-                                        size = codes_get_size(gid, kname)
-                                    except Exception:
-                                        size = None
-                                    if size and size > 1:
-                                        arr = codes_get_array(gid, kname)
-                                        # Join as comma-separated; keep integers as-is, floats with repr
-                                        if arr is None:
-                                            pass
-                                        else:
-                                            vals = []
-                                            for a in arr:
-                                                if isinstance(a, float):
-                                                    vals.append(repr(float(a)))
-                                                else:
-                                                    vals.append(str(int(a)))
-                                            xf.write(f'      <array name="{kname}">{",".join(vals)}</array>\n')
-                                    else:
-                                        val = codes_get(gid, kname)
-                                        if isinstance(val, float):
-                                            xf.write(f'      <key name="{kname}">{repr(float(val))}</key>\n')
-                                        else:
-                                            xf.write(f'      <key name="{kname}">{val}</key>\n')
-                                except Exception:
-                                    # Ignore keys we cannot read
-                                    pass
-                            codes_keys_iterator_delete(it)
-                            xf.write('    </dataRepresentationKeys>\n')
-                    except Exception:
-                        pass
 
-                    # Dump coded integer stream if available (enables exact reconstruction for complex packing)
-                    try:
-                        csize = None
+        # optional bitmap RLE (P=present, M=missing)
+        rle_str = None
+        if bitmap_mask is not None and bitmap_mask.size:
+            # run boundaries in one vectorized pass; only the (short) run list is joined in Python
+            changes = np.flatnonzero(np.concatenate(([True], bitmap_mask[1:] != bitmap_mask[:-1], [True])))
+            lengths = np.diff(changes)
+            flags = np.where(bitmap_mask[changes[:-1]], 'P', 'M')
+            rle_str = ' '.join(f"{f}{n}" for f, n in zip(flags.tolist(), lengths.tolist()))
+
+        # Write XML
+        xml_path = outdir / f"{prefix}_msg_{idx}.xml"
+        # Assemble in memory and hit the file once, rather than dozens of small buffered writes
+        with io.StringIO() as xf:
+            xf.write('<gribMessage version="1" index="%d">\n' % idx)
+            xf.write('  <ident>\n')
+            if centre is not None:  xf.write(f'    <centre>{centre}</centre>\n')
+            if sub_c is not None:   xf.write(f'    <subCentre>{sub_c}</subCentre>\n')
+            if disc is not None:    xf.write(f'    <discipline>{disc}</discipline>\n')
+            if pcat is not None:    xf.write(f'    <parameterCategory>{pcat}</parameterCategory>\n')
+            if pnum is not None:    xf.write(f'    <parameterNumber>{pnum}</parameterNumber>\n')
+            if sname is not None:   xf.write(f'    <shortName>{sname}</shortName>\n')
+            if tol is not None:     xf.write(f'    <typeOfLevel>{tol}</typeOfLevel>\n')
+            if level is not None:   xf.write(f'    <level>{level}</level>\n')
+            if date is not None:
+                hhmm = f"{time_:04d}" if isinstance(time_, int) else ''
+                xf.write(f'    <date ymd="{date}" hhmm="{hhmm}"/>\n')
+            if step_t is not None or step_r is not None:
+                xf.write(f'    <step type="{step_t if step_t is not None else ""}">\n')
+                if step_r is not None:
+                    xf.write(f'      <range>{step_r}</range>\n')
+                xf.write('    </step>\n')
+            xf.write('  </ident>\n')
+
+            xf.write('  <geometry>\n')
+            xf.write(f'    <gridType>{grid}</gridType>\n')
+            for tag, val in (('Ni',Ni),('Nj',Nj),('latitudeOfFirstGridPointInDegrees',la1),
+                             ('longitudeOfFirstGridPointInDegrees',lo1),
+                             ('iDirectionIncrementInDegrees',di),('jDirectionIncrementInDegrees',dj),
+                             ('scanningMode',scan)):
+                if val is not None:
+                    xf.write(f'    <{tag}>{val}</{tag}>\n')
+            xf.write('  </geometry>\n')
+
+            xf.write('  <representation>\n')
+            if ptype is not None:
+                xf.write(f'    <packingType>{ptype}</packingType>\n')
+            if drt is not None:
+                xf.write(f'    <dataRepresentationTemplateNumber>{drt}</dataRepresentationTemplateNumber>\n')
+            if bpv is not None:
+                xf.write(f'    <bitsPerValue>{bpv}</bitsPerValue>\n')
+            if bsf is not None:
+                xf.write(f'    <binaryScaleFactor>{bsf}</binaryScaleFactor>\n')
+            if dsf is not None:
+                xf.write(f'    <decimalScaleFactor>{dsf}</decimalScaleFactor>\n')
+            if refv is not None:
+                xf.write(f'    <referenceValue>{refv}</referenceValue>\n')
+            if rv_hex is not None:
+                xf.write(f'    <referenceValueHex>{rv_hex}</referenceValueHex>\n')
+            if mval is not None:
+                xf.write(f'    <missingValue>{mval}</missingValue>\n')
+            if mv_hex is not None:
+                xf.write(f'    <missingValueHex>{mv_hex}</missingValueHex>\n')
+            if mval2 is not None:
+                xf.write(f'    <secondaryMissingValue>{mval2}</secondaryMissingValue>\n')
+            if mv2_hex is not None:
+                xf.write(f'    <secondaryMissingValueHex>{mv2_hex}</secondaryMissingValueHex>\n')
+            if bmppr is not None:
+                xf.write(f'    <bitmapPresent>{bmppr}</bitmapPresent>\n')
+
+            # Dump all keys/arrays from the dataRepresentation namespace for exact reconstruction
+            try:
+                repr_keys = _repr_keys(gid)
+                if repr_keys is not None:
+                    xf.write('    <dataRepresentationKeys>\n')
+                    for kname, is_array in repr_keys:
                         try:
-                            csize = codes_get_size(gid, 'codedValues')
+                            if is_array:
+                                arr = codes_get_array(gid, kname)
+                                # Join as comma-separated; keep integers as-is, floats with repr
+                                if arr is None:
+                                    pass
+                                else:
+                                    vals = []
+                                    for a in arr:
+                                        if isinstance(a, float):
+                                            vals.append(repr(float(a)))
+                                        else:
+                                            vals.append(str(int(a)))
+                                    xf.write(f'      <array name="{kname}">{",".join(vals)}</array>\n')
+                            else:
+                                val = codes_get(gid, kname)
+                                if isinstance(val, float):
+                                    xf.write(f'      <key name="{kname}">{repr(float(val))}</key>\n')
+                                else:
+                                    xf.write(f'      <key name="{kname}">{val}</key>\n')
                         except Exception:
-                            csize = None
-                        if csize and csize > 0 and csize < 100000000:  # sanity cap
-                            cvals = None
-                            try:
-                                cvals = codes_get_array(gid, 'codedValues')
-                            except Exception:
-                                cvals = None
-                            if cvals is not None and len(cvals) == csize:
-                                xf.write('    <codedValues>')
-                                # write in chunks to avoid huge lines
-                                chunk = 100000
-                                for start in range(0, csize, chunk):
-                                    if start > 0:
-                                        xf.write('\n')
-                                    part = ','.join(str(int(v)) for v in cvals[start:start+chunk])
-                                    xf.write(part)
-                                xf.write('</codedValues>\n')
+                            # Ignore keys we cannot read
+                            pass
+                    xf.write('    </dataRepresentationKeys>\n')
+            except Exception:
+                pass
+
+            # Dump coded integer stream if available (enables exact reconstruction for complex packing)
+            try:
+                csize = None
+                try:
+                    csize = codes_get_size(gid, 'codedValues')
+                except Exception:
+                    csize = None
+                if csize and csize > 0 and csize < 100000000:  # sanity cap
+                    cvals = None
+                    try:
+                        cvals = codes_get_array(gid, 'codedValues')
                     except Exception:
-                        pass
-                    xf.write('  </representation>\n')
-
-                    xf.write('  <data>\n')
-                    if rle_str:
-                        xf.write(f'    <bitmap>{rle_str}</bitmap>\n')
-                    xf.write('    <values>')
-                    # Avoid ultra-long single lines for big grids
-                    chunk = 10000
-                    for start in range(0, len(tokens), chunk):
-                        if start > 0:
-                            xf.write('\n      ')
-                        xf.write(' '.join(tokens[start:start+chunk]))
-                    xf.write('</values>\n')
-                    xf.write('  </data>\n')
-                    xf.write('</gribMessage>\n')
-
-
-                written += 1
-            finally:
-                codes_release(gid)
-            idx += 1
-    return written
+                        cvals = None
+                    if cvals is not None and len(cvals) == csize:
+                        xf.write('    <codedValues>')
+                        # write in chunks to avoid huge lines
+                        chunk = 100000
+                        for start in range(0, csize, chunk):
+                            if start > 0:
+                                xf.write('\n')
+                            part = ','.join(str(int(v)) for v in cvals[start:start+chunk])
+                            xf.write(part)
+                        xf.write('</codedValues>\n')
+            except Exception:
+                pass
+            xf.write('  </representation>\n')
+
+            xf.write('  <data>\n')
+            if rle_str:
+                xf.write(f'    <bitmap>{rle_str}</bitmap>\n')
+            if sidecar:
+                # Sidecar first: the XML never references a file that isn't there yet
+                npy_path = xml_path.with_suffix('.npy')
+                npy_tmp = npy_path.with_name(npy_path.name + '.part')
+                with open(npy_tmp, 'wb') as nf:
+                    np.save(nf, masked)
+                os.replace(npy_tmp, npy_path)
+                xf.write(f'    <values encoding="npy" dtype="{vdtype}" n="{masked.size}" href="{npy_path.name}"/>\n')
+            elif binary:
+                payload = base64.b64encode(masked.astype(masked.dtype.newbyteorder('<'), copy=False).tobytes()).decode('ascii')
+                xf.write(f'    <values encoding="base64" dtype="{vdtype}" n="{masked.size}">{payload}</values>\n')
+            else:
+                xf.write('    <values dtype="float32">' if vdtype == 'float32' else '    <values>')
+                # Avoid ultra-long single lines for big grids (10k values per line)
+                xf.write(_format_values(masked, vfmt))
+                xf.write('</values>\n')
+            xf.write('  </data>\n')
+            xf.write('</gribMessage>\n')
+            _write_file(xml_path, xf.getvalue().encode('utf-8'))
+    finally:
+        codes_release(gid)
+
+
+def dump_grib_to_xml(in_grib: Path, outdir: Path, prefix: str, workers: int | None = None,
+                     binary: bool = False, resume: bool = False, sidecar: bool = False) -> int:
+    """Dump all GRIB messages to rich XML (values + metadata).
+
+    XML schema (simplified):
+      <gribMessage version="1" index="i">
+        <ident>...</ident>
+        <geometry>...</geometry>
+        <representation>...</representation>
+        <data>
+          <bitmap>RLE</bitmap>
+          <values>v1 v2 ...</values>   (or base64 with binary=True: float32 when the field is
+                                       exactly representable in float32, else float64,
+                                       as given by the dtype attribute;
+                                       or an href to a .npy sidecar with sidecar=True)
+        </data>
+      </gribMessage>
+
+    Messages are independent, so they are sharded across ``workers`` processes
+    (default: one per CPU; ``workers=1`` runs in-process). With ``resume``,
+    messages whose XML already exists are skipped without being decoded.
+
+    Returns number of messages written.
+    """
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    def todo(fin):
+        # with resume, existing XML is skipped by index alone; nothing is decoded for it
+        for idx, msg in enumerate(iter_messages(fin)):
+            if not (resume and (outdir / f"{prefix}_msg_{idx}.xml").exists()):
+                yield idx, msg
+
+    # Messages are read lazily from the mapped input and only a bounded window is in flight,
+    # so the parent never holds more than a few messages' bytes at once
+    n = 0
+    with open(in_grib, 'rb') as fin:
+        if workers == 1:
+            for n, (idx, msg) in enumerate(todo(fin), 1):
+                _dump_message(msg, idx, outdir, prefix, binary, sidecar)
+        else:
+            window = 2 * (workers or os.cpu_count() or 1)
+            pending = collections.deque()
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                for n, (idx, msg) in enumerate(todo(fin), 1):
+                    pending.append(ex.submit(_dump_message, msg, idx, outdir, prefix, binary, sidecar))
+                    if len(pending) >= window:
+                        pending.popleft().result()
+                while pending:
+                    pending.popleft().result()
+    return n
 
 
 if __name__ == "__main__":
@@ -317,6 +421,16 @@ if __name__ == "__main__":
                    help='Directory to write XML files (all files share this directory).')
     p.add_argument('--prefix', dest='prefix', type=str, default=None,
                    help='Optional filename prefix override. If omitted, each file uses its own basename.')
+    p.add_argument('--workers', dest='workers', type=int, default=None,
+                   help='Worker processes per file (default: CPU count; 1 disables multiprocessing).')
+    enc = p.add_mutually_exclusive_group()
+    enc.add_argument('--binary', dest='binary', action='store_true',
+                     help='Write values as base64 instead of decimal text (smaller, much faster): float32 when '
+                          'exact, otherwise float64, as given by the dtype attribute.')
+    enc.add_argument('--sidecar', dest='sidecar', action='store_true',
+                     help='Write values to a .npy file next to each XML (no text to format or parse).')
+    p.add_argument('--resume', dest='resume', action='store_true',
+                   help='Skip messages whose XML already exists in --outdir (restart an interrupted run).')
     args = p.parse_args()
 
     inputs = args.in_grib or [DATA_DIR / 'small_subset_500mb.grb2']
@@ -324,7 +438,8 @@ if __name__ == "__main__":
     total_written = 0
     for in_path in inputs:
         this_prefix = args.prefix or in_path.stem
-        count = dump_grib_to_xml(in_path, args.outdir, this_prefix)
+        count = dump_grib_to_xml(in_path, args.outdir, this_prefix, args.workers, args.binary, args.resume,
+                                  args.sidecar)
         print(f"XML dump summary [{in_path.name}]: wrote {count} messages to {args.outdir} (prefix='{this_prefix}')")
         total_written += count
     print(f"DONE. Files processed: {len(inputs)} | Total messages written: {total_written}")
\ No newline at end of file
@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
-import argparse, base64, hashlib, os, re, sys
+import argparse, base64, collections, hashlib, mmap, os, re, sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pybase64  # optional: SIMD (AVX2/NEON) base64 via libbase64
+except ImportError:
+    pybase64 = None
 
 # Streaming XML reader without building the whole tree.
 # Relies on simple regex to parse our own <chunk ...>...</chunk> format safely.
@@ -13,46 +19,64 @@ HEADER_RE = re.compile(rb'<gribpackage[^>]*sha256="(?P<sha>[0-9a-f]{64})"[^>]*>'
 
 def stream_chunks(xml_path):
     with open(xml_path, 'rb') as f:
-        buf = b''
+        buf = bytearray()
+        pos = 0
+        blk = bytearray(1024*1024)
         file_sha_hex = None
         # find header sha256
         # read in blocks
         while True:
-            blk = f.read(1024*1024)
-            if not blk:
+            n = f.readinto(blk)
+            if not n:
                 break
-            buf += blk
+            buf += memoryview(blk)[:n]
             if file_sha_hex is None:
                 m = HEADER_RE.search(buf)
                 if m:
                     file_sha_hex = m.group('sha').decode('ascii')
-            # extract chunks iteratively
-            while True:
-                m = CHUNK_OPEN_RE.search(buf)
-                if not m:
-                    # keep tail to avoid splitting tags
-                    buf = buf[-4096:]
-                    break
-                start = m.start()
+            # extract chunks with one linear regex sweep over the buffer, tracking a cursor
+            for m in CHUNK_OPEN_RE.finditer(buf, pos):
                 # find close tag from m.end()
                 close_pos = buf.find(CHUNK_CLOSE, m.end())
                 if close_pos == -1:
                     # need more data
-                    # keep from start for next round
-                    buf = buf[start:]
+                    # keep from this tag for next round
+                    pos = m.start()
                     break
-                # Extract chunk content
-                content_start = m.end()
-                content = buf[content_start:close_pos]
-                # advance buffer
-                buf = buf[close_pos + len(CHUNK_CLOSE):]
+                # Extract chunk content (one copy; a memoryview would pin buf against the compaction below)
+                content = buf[m.end():close_pos]
+                # advance cursor
+                pos = close_pos + len(CHUNK_CLOSE)
 
-                # yield chunk
-                ci = int(m.group('i'))
-                off = int(m.group('off'))
-                blen = int(m.group('len'))
-                csha = m.group('sha').decode('ascii')
+                # yield chunk: one groups() call (i, off, len, sha in pattern order);
+                # int() parses the ASCII digit bytes directly, no str decode in between
+                i, off, blen, csha = m.groups()
+                ci, off, blen = int(i), int(off), int(blen)
+                csha = csha.decode('ascii')
                 yield (ci, off, blen, csha, content), file_sha_hex
+            else:
+                # keep tail to avoid splitting tags
+                pos = max(pos, len(buf) - 4096)
+            # drop consumed bytes once per refill instead of re-slicing per chunk
+            del buf[:pos]
+            pos = 0
+
+# libbase64's SIMD decoder only pays off past ~1 KB; tiny chunks stay on the stdlib path
+PYBASE64_MIN = 1024
+
+def b64decode(b64):
+    if pybase64 is not None and len(b64) >= PYBASE64_MIN:
+        return pybase64.b64decode(b64, validate=False)
+    return base64.b64decode(b64)
+
+def decode_and_verify(x, ci, blen, csha, b64):
+    raw = b64decode(b64)
+    # verify per-chunk len/sha
+    if len(raw) != blen:
+        raise RuntimeError(f"{x}: chunk {ci} length mismatch {len(raw)} != {blen}")
+    if hashlib.sha256(raw).hexdigest() != csha:
+        raise RuntimeError(f"{x}: chunk {ci} sha256 mismatch")
+    return raw
 
 def main():
     p = argparse.ArgumentParser(description="Lossless, fast XML→GRIB reassembler (chunked).")
@@ -68,24 +92,40 @@ def main():
         os.remove(tmp_out)
 
     # index chunks by offset across all xml files (in case of split)
+    # decode+verify runs on threads (hashlib and pybase64 drop the GIL on large buffers);
+    # a bounded window of in-flight chunks keeps memory flat while the parser stays ahead
     index = []
-    for x in args.xml:
-        for (ci, off, blen, csha, b64), file_sha in stream_chunks(x):
-            raw = base64.b64decode(b64)
-            # verify per-chunk len/sha
-            if len(raw) != blen:
-                raise RuntimeError(f"{x}: chunk {ci} length mismatch {len(raw)} != {blen}")
-            if hashlib.sha256(raw).hexdigest() != csha:
-                raise RuntimeError(f"{x}: chunk {ci} sha256 mismatch")
-            index.append((off, raw))
+    workers = os.cpu_count() or 1
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for x in args.xml:
+            for (ci, off, blen, csha, b64), file_sha in stream_chunks(x):
+                pending.append((off, ex.submit(decode_and_verify, x, ci, blen, csha, b64)))
+                if len(pending) >= 4 * workers:
+                    off, fut = pending.popleft()
+                    index.append((off, fut.result()))
+        while pending:
+            off, fut = pending.popleft()
+            index.append((off, fut.result()))
 
-    # write in offset order
-    index.sort(key=lambda t: t[0])
-    with open(tmp_out, 'wb') as out:
-        for off, raw in index:
-            out.seek(off)
-            out.write(raw)
-            out_sha.update(raw)
+    # size the file once, then scatter chunks into a shared mapping; every chunk lands at its
+    # absolute offset and the hash is taken over the finished mapping, so no sort is needed
+    total = max((off + len(raw) for off, raw in index), default=0)
+    fd = os.open(tmp_out, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        os.ftruncate(fd, total)
+        if total:
+            # reserve blocks up front so a full disk fails here, not as SIGBUS on a mapped page
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, total)
+            with mmap.mmap(fd, total) as mm:
+                for off, raw in index:
+                    mm[off:off + len(raw)] = raw
+                mm.flush()
+                # one hash over the whole contiguous mapping (GIL released) instead of a call per chunk
+                out_sha.update(mm)
+    finally:
+        os.close(fd)
 
     # rename final
     os.replace(tmp_out, args.out)
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
+import argparse
+import collections
+import io
+import numpy as np
 import pygrib
-import xml.etree.ElementTree as ET
-import xmlschema
+from xml.sax.saxutils import quoteattr
 import os
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 from pathlib import Path  # Add this if missing
 
+try:
+    from lxml import etree as lxml_etree  # optional: libxml2's C validator, much faster than xmlschema
+except ImportError:
+    lxml_etree = None
+
 # Project paths (based on your structure)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent  # Resolves symlinks
 DATA_DIR = PROJECT_ROOT / 'data'
@@ -21,63 +30,165 @@ print(f"XSD file: {XSD_FILE}")
 # Create output directory if it doesn't exist
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-# Function to process a single GRIB message into an XML file
-def process_message(msg, index, grb_filename):
-    root = ET.Element('grib')
-    var = ET.SubElement(root, 'variable', name=msg.name, date=str(msg.validDate), level=msg.typeOfLevel)
-    ET.SubElement(var, 'values').text = ' '.join(map(str, msg.values.flatten()))
-    ET.SubElement(var, 'lat').text = ' '.join(map(str, msg.latitudes.flatten()))
-    ET.SubElement(var, 'lon').text = ' '.join(map(str, msg.longitudes.flatten()))
-    
+# Compiled XSD, built once per process (parsing grib.xsd dwarfs validating a small message)
+_SCHEMA = None
+
+def _init_schema():
+    global _SCHEMA
+    if _SCHEMA is None:
+        if lxml_etree is not None:
+            _SCHEMA = lxml_etree.XMLSchema(lxml_etree.parse(str(XSD_FILE)))
+        else:
+            import xmlschema  # pure-Python fallback, only needed without lxml
+            _SCHEMA = xmlschema.XMLSchema(str(XSD_FILE))
+    return _SCHEMA
+
+# Raise on an invalid document, whichever backend compiled the schema
+def _validate_file(xml_path):
+    schema = _init_schema()
+    if lxml_etree is not None:
+        schema.assertValid(lxml_etree.parse(str(xml_path)))
+    else:
+        schema.validate(str(xml_path))
+
+# Validation threads in the parent: XSD checks overlap with workers formatting later messages
+_VALIDATE_POOL = ThreadPoolExecutor(max_workers=2)
+
+def _validate(xml_path, index, grb_filename):
+    try:
+        _validate_file(xml_path)
+        print(f"Generated and validated: {xml_path}")
+    except Exception as e:
+        print(f"Error processing message {index} for {grb_filename}: {str(e)}")
+
+# Format a (possibly masked) array as space-separated text in one NumPy pass; masked points -> '--'
+def _format_floats(arr):
+    flat = np.ma.filled(arr.astype(np.float64, copy=False), np.nan).ravel()
+    buf = io.StringIO()
+    np.savetxt(buf, flat[None, :], fmt='%.17g', delimiter=' ', newline='')
+    return buf.getvalue().replace('nan', '--')
+
+# Stream an array's text to xf in fixed-size blocks so only one block of text is alive at a time
+def _write_floats(xf, arr, block=65536):
+    flat = np.ravel(arr)
+    for start in range(0, flat.size, block):
+        if start:
+            xf.write(' ')
+        xf.write(_format_floats(flat[start:start + block]))
+
+# Write one message's XML; fields are (name, validDate string, typeOfLevel), arrays are (values, lat, lon)
+def _write_message_xml(xml_path, fields, arrays):
+    # Stream elements straight to disk instead of building an in-memory ElementTree first
+    with open(xml_path, 'w', encoding='utf-8') as xf:
+        xf.write('<grib><variable name=%s date=%s level=%s>' % tuple(quoteattr(f) for f in fields))
+        for tag, arr in zip(('values', 'lat', 'lon'), arrays):
+            xf.write(f'<{tag}>')
+            _write_floats(xf, arr)
+            xf.write(f'</{tag}>')
+        xf.write('</variable></grib>')
+
+def _xml_path(grb_filename, index):
     # Name XML based on original GRIB and message index
-    xml_filename = f"{os.path.splitext(grb_filename)[0]}_msg_{index}.xml"
-    xml_path = OUTPUT_DIR / xml_filename
-    ET.ElementTree(root).write(str(xml_path))
-    
-    # Validate against XSD
-    schema = xmlschema.XMLSchema(str(XSD_FILE))
-    schema.validate(str(xml_path))
+    return OUTPUT_DIR / f"{os.path.splitext(grb_filename)[0]}_msg_{index}.xml"
+
+# Function to process a single GRIB message into an XML file
+def process_message(msg, index, grb_filename, validate=False):
+    xml_path = _xml_path(grb_filename, index)
+    _write_message_xml(xml_path, (msg.name, str(msg.validDate), msg.typeOfLevel),
+                       (msg.values, msg.latitudes, msg.longitudes))
     
-    print(f"Generated and validated: {xml_path}")
+    # Validate against XSD only on request
+    if validate:
+        _validate_file(xml_path)
+        print(f"Generated and validated: {xml_path}")
+    return xml_path
+
+# Parent side: copy values/lat/lon into one shared-memory block (masked points as NaN),
+# so workers receive a block name and sizes instead of pickled arrays
+def _share_message(msg):
+    arrays = [np.ma.filled(np.ma.asarray(a, dtype=np.float64), np.nan).ravel()
+              for a in (msg.values, msg.latitudes, msg.longitudes)]
+    sizes = tuple(a.size for a in arrays)
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * sum(sizes), 1))
+    np.concatenate(arrays, out=np.ndarray((sum(sizes),), dtype=np.float64, buffer=shm.buf))
+    return shm, sizes
+
+def _write_shared(xml_path, fields, buf, sizes):
+    flat = np.ndarray((sum(sizes),), dtype=np.float64, buffer=buf)
+    _write_message_xml(xml_path, fields, np.split(flat, np.cumsum(sizes)[:-1]))
 
-# Function to convert a single GRIB file (sequential for debugging)
-def convert_grib_to_xml(grb_path):
+# Worker entry point: only plain tuples cross the process boundary, workers never touch pygrib
+def _process_message_shared(task):
+    index, fields, shm_name, sizes, grb_filename = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        print(f"Processing message {index} for {grb_filename}...")
+        xml_path = _xml_path(grb_filename, index)
+        _write_shared(xml_path, fields, shm.buf, sizes)
+        return xml_path
+    except Exception as e:
+        print(f"Error processing message {index} for {grb_filename}: {str(e)}")
+        return None
+    finally:
+        shm.close()
+
+# Function to convert a single GRIB file (messages fanned out across processes)
+def convert_grib_to_xml(grb_path, validate=False):
     grbs = pygrib.open(str(grb_path))
-    messages = list(grbs)
-    grbs.close()
+    n_messages = grbs.messages
     
-    grb_filename = grb_path.name
-    print(f"Number of messages in {grb_path}: {len(messages)}")
+    print(f"Number of messages in {grb_path}: {n_messages}")
     
-    # Process sequentially with error handling
-    for index, msg in enumerate(messages):
+    # CPU-bound formatting: one process per core, fed by the parent decoding messages in order.
+    # A bounded window of in-flight messages caps how much shared memory is live at once.
+    # Each XML is handed to the validation threads as soon as its worker finishes.
+    if validate:
+        _init_schema()
+    validations = []
+    workers = os.cpu_count() or 1
+    pending = collections.deque()
+
+    def finish(index, shm, fut):
         try:
-            print(f"Processing message {index} for {grb_filename}...")
-            root = ET.Element('grib')
-            var = ET.SubElement(root, 'variable', name=msg.name, date=str(msg.validDate), level=msg.typeOfLevel)
-            values_text = ' '.join(map(str, msg.values.flatten()))
-            lat_text = ' '.join(map(str, msg.latitudes.flatten()))
-            lon_text = ' '.join(map(str, msg.longitudes.flatten()))
-            ET.SubElement(var, 'values').text = values_text
-            ET.SubElement(var, 'lat').text = lat_text
-            ET.SubElement(var, 'lon').text = lon_text
-            
-            xml_filename = f"{os.path.splitext(grb_filename)[0]}_msg_{index}.xml"
-            xml_path = OUTPUT_DIR / xml_filename
-            print(f"Attempting to write: {xml_path}")
-            
-            ET.ElementTree(root).write(str(xml_path))  # Use str() for compatibility
-            
-            schema = xmlschema.XMLSchema(str(XSD_FILE))
-            schema.validate(str(xml_path))
-            print(f"Successfully generated and validated: {xml_path}")
-        except Exception as e:
-            print(f"Error processing message {index} for {grb_filename}: {str(e)}")
+            xml_path = fut.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        if xml_path is None:
+            return
+        if validate:
+            validations.append(_VALIDATE_POOL.submit(_validate, xml_path, index, grb_path.name))
+        else:
+            print(f"Generated: {xml_path}")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for index, msg in enumerate(grbs):
+                shm, sizes = _share_message(msg)
+                fields = (msg.name, str(msg.validDate), msg.typeOfLevel)
+                task = (index, fields, shm.name, sizes, grb_path.name)
+                pending.append((index, shm, executor.submit(_process_message_shared, task)))
+                if len(pending) >= 2 * workers:
+                    finish(*pending.popleft())
+            while pending:
+                finish(*pending.popleft())
+    finally:
+        grbs.close()
+        # Only non-empty after an error: release blocks whose results were never collected
+        for _, shm, _ in pending:
+            shm.close()
+            shm.unlink()
+    for fut in validations:
+        fut.result()
     
     print(f"Conversion complete for {grb_path}. XML files in {OUTPUT_DIR}")
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert GRIB messages to XML")
+    parser.add_argument("--validate", action="store_true", help="Validate the generated XML against the XSD (slower)")
+    args = parser.parse_args()
+
     # List your GRIB files from data/ (using Path objects)
     grib_files = [
         DATA_DIR / 'large_full_1deg.grb2',
@@ -86,6 +197,6 @@ if __name__ == "__main__":
     
     for grib_file in grib_files:
         if grib_file.exists():
-            convert_grib_to_xml(grib_file)
+            convert_grib_to_xml(grib_file, validate=args.validate)
         else:
             print(f"File not found: {grib_file}")
\ No newline at end of file
@@ -1,12 +1,17 @@
-import xarray as xr
+try:
+    from weather._grib_messages import scan
+except ImportError:  # run as a script: src/weather itself is on sys.path
+    from _grib_messages import scan
+
+KEYS = ("shortName", "typeOfLevel", "level", "dataDate", "dataTime", "stepRange", "gridType", "numberOfPoints")
 
 def inspect_grib(filepath: str):
-    ds = xr.open_dataset(filepath, engine="cfgrib")
-    print("Variables in file:", list(ds.data_vars))
-    print("Coordinates:", list(ds.coords))
+    messages = scan(filepath, KEYS)
+    print("Variables in file:", list(dict.fromkeys(m["shortName"] for m in messages)))
+    print("Levels:", sorted({(m["typeOfLevel"], m["level"]) for m in messages}))
     print("\nPreview:")
-    print(ds)
+    for i, m in enumerate(messages):
+        print(f"  [{i}] " + " ".join(f"{k}={m[k]}" for k in KEYS))
 
 if __name__ == "__main__":
     inspect_grib("data/QPF06hr_00z.grb")
-    
\ No newline at end of file
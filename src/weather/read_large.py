@@ -1,57 +1,56 @@
-import xarray as xr
-import tempfile
+import numpy as np
+from eccodes import *
+
+try:
+    from weather._grib_messages import scan
+except ImportError:  # run as a script: src/weather itself is on sys.path
+    from _grib_messages import scan
 
 LARGE = "data/large_full_1deg.grb2"
 
-def open_group(path, type_of_level):
-    cache_dir = tempfile.gettempdir()
-    return xr.open_dataset(
-        path,
-        engine="cfgrib",
-        backend_kwargs={
-            "indexpath": f"{cache_dir}/cfgrib_index_large_{type_of_level}",
-            "filter_by_keys": {"typeOfLevel": type_of_level},
-        },
-    )
+KEYS = ("shortName", "typeOfLevel", "level", "dataDate", "dataTime", "stepRange", "gridType", "Ni", "Nj", "offset")
 
 def main():
+    messages = scan(LARGE, KEYS)
+
     # Try pressure levels first; fall back to surface
-    try:
-        ds = open_group(LARGE, "isobaricInhPa")
-        group = "isobaricInhPa"
-    except Exception:
-        ds = open_group(LARGE, "surface")
+    group = "isobaricInhPa"
+    selected = [m for m in messages if m["typeOfLevel"] == group]
+    if not selected:
         group = "surface"
+        selected = [m for m in messages if m["typeOfLevel"] == group]
 
     print(f"Opened group: {group}")
-    print("Dims:", dict(ds.sizes))
-    print("Coords:", list(ds.coords))
-    print("Vars:", list(ds.data_vars))
-
-    # 1) Index positional dims safely (if they exist)
-    if "time" in ds.dims:
-        ds = ds.isel(time=0)
-    if "step" in ds.dims:
-        ds = ds.isel(step=0)
-
-    # 2) Select 500 hPa by label if available
-    if "isobaricInhPa" in ds.coords and 500 in ds.isobaricInhPa.values:
-        ds = ds.sel(isobaricInhPa=500)
-
-    # 3) Peek at the first variable on a tiny window
-    var_name = list(ds.data_vars)[0]
-    da = ds[var_name]
-    slicer = {}
-    if "latitude" in da.dims:
-        slicer["latitude"] = slice(0, 10)
-    if "longitude" in da.dims:
-        slicer["longitude"] = slice(0, 10)
-    da_small = da.isel(**slicer) if slicer else da
-
-    print(f"\nPeek var={var_name}, full_shape={da.shape}, window_shape={da_small.shape}")
-    print("Min/Max on small window:", float(da_small.min()), float(da_small.max()))
-
-    ds.close()
+    print("Messages:", len(selected))
+    print("Levels:", sorted({m["level"] for m in selected}))
+    print("Vars:", list(dict.fromkeys(m["shortName"] for m in selected)))
+
+    # Peek at the first variable: first time/step in file order, 500 hPa if present
+    var_name = selected[0]["shortName"]
+    candidates = [m for m in selected if m["shortName"] == var_name]
+    msg = next((m for m in candidates if group == "isobaricInhPa" and m["level"] == 500), candidates[0])
+
+    # Decode only that one message, straight from its byte offset
+    with open(LARGE, "rb") as f:
+        f.seek(int(msg["offset"]))
+        gid = codes_grib_new_from_file(f)
+        try:
+            values = codes_get_values(gid)
+            if codes_get(gid, "bitmapPresent"):
+                values[values == codes_get(gid, "missingValue")] = np.nan
+        finally:
+            codes_release(gid)
+    if msg["Ni"] and msg["Nj"] and msg["Ni"] * msg["Nj"] == values.size:
+        field = values.reshape(msg["Nj"], msg["Ni"])
+        window = field[:10, :10]
+    else:
+        # reduced Gaussian, spectral and other non-rectangular fields have no Nj x Ni shape
+        # (Ni reads back as MISSING, or is absent altogether)
+        field = values
+        window = values[:100]
+
+    print(f"\nPeek var={var_name}, gridType={msg['gridType']}, full_shape={field.shape}, window_shape={window.shape}")
+    print("Min/Max on small window:", float(np.nanmin(window)), float(np.nanmax(window)))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
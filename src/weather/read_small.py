@@ -1,20 +1,20 @@
-import xarray as xr
-import tempfile
+try:
+    from weather._grib_messages import scan
+except ImportError:  # run as a script: src/weather itself is on sys.path
+    from _grib_messages import scan
 
 SMALL = "data/small_subset_500mb.grb2"
 
+KEYS = ("shortName", "typeOfLevel", "level", "dataDate", "dataTime", "stepRange", "Ni", "Nj")
+
 def main():
-    # use a writable temp dir for cfgrib index files
-    cache_dir = tempfile.gettempdir()
-    ds = xr.open_dataset(
-        SMALL,
-        engine="cfgrib",
-        backend_kwargs={"indexpath": f"{cache_dir}/cfgrib_index_small"}
-    )
-    print("Data variables:", list(ds.data_vars))
-    print("Coordinates:", list(ds.coords))
-    print("\nDataset summary:\n", ds)
-    ds.close()
+    # iterate messages straight from eccodes; no cfgrib index or xarray Dataset to build
+    messages = scan(SMALL, KEYS)
+    print("Data variables:", list(dict.fromkeys(m["shortName"] for m in messages)))
+    print("Levels:", sorted({(m["typeOfLevel"], m["level"]) for m in messages}))
+    print("\nMessage summary:")
+    for i, m in enumerate(messages):
+        print(f"  [{i}] " + " ".join(f"{k}={m[k]}" for k in KEYS))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 # Reconstruct GRIB files from XML/value dumps, or via byte-identical concatenation
 import argparse
-import contextlib
+import collections
+import functools
 import os
+import re
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-import xml.etree.ElementTree as ET
 
 # Silence ecCodes logging/debug BEFORE importing eccodes
 os.environ.setdefault('ECCODES_LOG_STREAM', os.devnull)
@@ -13,51 +16,68 @@ os.environ.setdefault('ECCODES_DEBUG', '0')
 import numpy as np
 from eccodes import *  # noqa: F401,F403
 
+try:
+    from weather._grib_messages import iter_messages, silence_stderr, silenced_stderr
+    from weather._xml_values import find_values, fromstring_numbers, parse_xml, values_from_node
+except ImportError:  # run as a script: src/weather itself is on sys.path
+    from _grib_messages import iter_messages, silence_stderr, silenced_stderr
+    from _xml_values import find_values, fromstring_numbers, parse_xml, values_from_node
+
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / 'data'
 OUTPUT_XML = PROJECT_ROOT / 'output_xml'
 
-# shared stderr sink for noisy library messages
-_ESS_NULL = open(os.devnull, 'w')
+_BE_F4 = struct.Struct('>f')
+
+
+def _f4_from_hex(hex_str: str) -> float:
+    """Big-endian IEEE float32 hex (as dumped by convert_grb.py) -> float, without a NumPy round-trip."""
+    return _BE_F4.unpack_from(bytes.fromhex(hex_str))[0]
+
+
+_INT_RE = re.compile(r'[+-]?\d+')
+_FLOAT_RE = re.compile(r'[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|nan|inf(?:inity)?)', re.I)
+
+
+@functools.lru_cache(maxsize=4096)
+def _coerce(txt: str):
+    """int, then float, else the string itself; dispatched by regex so no ValueError is raised.
+    Memoized: section-5 key values repeat heavily across messages."""
+    if _INT_RE.fullmatch(txt):
+        return int(txt)
+    if _FLOAT_RE.fullmatch(txt):
+        return float(txt)
+    return txt
 
 
 def _read_from_xml(xml_path: Path):
     """Read values and best-effort metadata from an XML produced by convert_grb.py.
-    Returns: (values: np.ndarray float64, meta: dict)
+    Returns: (values: np.ndarray float64, meta: dict); values is always a fresh, writable float64 array.
     Compatible with both <gribMessage> and legacy <values> layout.
     """
-    tree = ET.parse(str(xml_path))
-    root = tree.getroot()
-
-    # Values node (avoid truthiness deprecation on Element)
-    vnode = root.find('data/values')
-    if vnode is None:
-        vnode = root.find('.//values')
-    if vnode is None:
-        raise ValueError(f"Could not find <values> in {xml_path}")
-
-    text = (vnode.text or '').strip()
-    if text:
-        toks = [t for part in text.splitlines() for t in part.replace(',', ' ').split()]
-    else:
-        toks = [(child.text or '').strip() for child in list(vnode) if (getattr(child, 'tag', '').lower() == 'value')]
-
-    def _to_float(tok: str) -> float:
-        t = tok.strip()
-        if t in {'--', 'NaN', 'nan', ''}:
-            return np.nan
-        return float(t)
-
-    values = np.fromiter((_to_float(t) for t in toks), dtype=np.float64)
-
-    # Meta (best-effort)
-    def gx(path, cast=str, default=None):
+    root = parse_xml(xml_path)
+    values = values_from_node(find_values(root, xml_path), xml_path)
+
+    # Meta (best-effort): one pass over each section's children instead of a find() per key
+    def _children(path):
         node = root.find(path)
-        if node is None:
+        texts = {}
+        if node is not None:
+            for child in node:
+                if isinstance(child.tag, str):  # skip comments/PIs
+                    texts.setdefault(child.tag, child.text)
+        return texts
+
+    sections = {'representation': _children('representation'), 'geometry': _children('geometry')}
+
+    def gx(path, cast=str, default=None):
+        section, _, key = path.partition('/')
+        text = sections[section].get(key)
+        if text is None:
+            # missing or empty node
             return default
         try:
-            # some numeric nodes may be empty
-            return cast(node.text) if node.text is not None else default
+            return cast(text)
         except Exception:
             return default
 
@@ -84,23 +104,12 @@ def _read_from_xml(xml_path: Path):
     repr_arrays = {}
     drk = root.find('representation/dataRepresentationKeys')
     if drk is not None:
-        # Scalar keys
+        # Scalar keys: prefer int, then float, else keep string
         for kn in drk.findall('key'):
             name = kn.get('name')
-            if not name:
-                continue
             txt = (kn.text or '').strip()
-            if txt == '':
-                continue
-            # Prefer int, then float, else keep string
-            try:
-                val = int(txt)
-            except Exception:
-                try:
-                    val = float(txt)
-                except Exception:
-                    val = txt
-            repr_keys[name] = val
+            if name and txt:
+                repr_keys[name] = _coerce(txt)
         # Array keys
         for an in drk.findall('array'):
             name = an.get('name')
@@ -109,17 +118,19 @@ def _read_from_xml(xml_path: Path):
             txt = (an.text or '').strip()
             if txt == '':
                 continue
-            parts = [p.strip() for p in txt.split(',') if p.strip() != '']
-            arr = []
-            for p in parts:
-                try:
-                    arr.append(int(p))
-                except Exception:
-                    try:
-                        arr.append(float(p))
-                    except Exception:
-                        # skip
-                        pass
+            # int64 when every element is an integer (long array), else float64 (double array);
+            # eccodes takes the ndarray directly
+            arr = fromstring_numbers(txt, np.int64)
+            if arr is None:
+                arr = fromstring_numbers(txt)
+            if arr is None:
+                # malformed element(s): per-element int/float, skipping what parses as neither
+                arr = []
+                for p in (p.strip() for p in txt.split(',')):
+                    if p:
+                        val = _coerce(p)
+                        if not isinstance(val, str):
+                            arr.append(val)
             repr_arrays[name] = arr
     meta['repr_keys'] = repr_keys
     meta['repr_arrays'] = repr_arrays
@@ -139,201 +150,216 @@ def _read_from_xml(xml_path: Path):
     # Optional bitmap RLE -> boolean mask
     bnode = root.find('data/bitmap')
     if bnode is not None and bnode.text:
-        runs = bnode.text.strip().split()
-        mask = []
-        for run in runs:
-            if not run:
-                continue
-            tag = run[0]
-            n = int(run[1:]) if len(run) > 1 else 0
-            flag = (tag == 'P')
-            mask.extend([flag] * n)
-        meta['bitmap'] = np.array(mask, dtype=bool)
+        # one flag + count per run, expanded in C by np.repeat
+        runs = bnode.text.split()
+        flags = np.fromiter((run[0] == 'P' for run in runs), dtype=bool, count=len(runs))
+        counts = np.fromiter((int(run[1:] or 0) for run in runs), dtype=np.int64, count=len(runs))
+        meta['bitmap'] = np.repeat(flags, counts)
 
     return values, meta
 
 
-def decode_xml_to_grib(original_grb_path: Path, reconstructed_grb_path: Path, xml_prefix: str, packing_mode: str = 'original') -> None:
-    reconstructed = 0
-    reconstructed_grb_path.parent.mkdir(parents=True, exist_ok=True)
+def _load_xml(msg_index: int, xml_prefix: str):
+    """Read the XML dump of one message. No ecCodes calls, so it is safe to run on a prefetch thread."""
+    xml_path = OUTPUT_XML / f"{xml_prefix}_msg_{msg_index}.xml"
+    if not xml_path.exists():
+        raise FileNotFoundError(f"Missing XML for message {msg_index}: {xml_path}")
+    return _read_from_xml(xml_path)
 
-    with open(original_grb_path, 'rb') as fin, open(reconstructed_grb_path, 'wb') as fout:
-        msg_index = 0
-        while True:
-            with contextlib.redirect_stderr(_ESS_NULL):
-                gid = codes_grib_new_from_file(fin)
-            if gid is None:
-                break
-            try:
-                with contextlib.redirect_stderr(_ESS_NULL):
-                    clone_id = codes_clone(gid)
 
-                # Optional IEEE packing for exact decoded values
-                force_ieee = (packing_mode in ('ieee32', 'ieee64'))
-                if force_ieee:
-                    with contextlib.redirect_stderr(_ESS_NULL):
-                        try:
-                            codes_set(clone_id, 'packingType', 'grid_ieee')
-                        except Exception:
-                            pass
-                        try:
-                            # precision: 1 -> 32-bit, 2 -> 64-bit
-                            codes_set(clone_id, 'precision', 1 if packing_mode == 'ieee32' else 2)
-                        except Exception:
-                            pass
+def _reconstruct_message(msg: bytes, msg_index: int, xml_prefix: str, packing_mode: str,
+                         validate: bool = False) -> bytes:
+    """Rebuild one message from its source bytes and XML dump; returns the encoded GRIB bytes.
+    Top-level (and fed plain bytes) so it can run in a worker process.
+    """
+    values, meta = _load_xml(msg_index, xml_prefix)
+    return _encode_message(msg, msg_index, values, meta, packing_mode, validate)
 
-                # Load XML for this message
-                xml_path = OUTPUT_XML / f"{xml_prefix}_msg_{msg_index}.xml"
-                if not xml_path.exists():
-                    raise FileNotFoundError(f"Missing XML for message {msg_index}: {xml_path}")
 
-                values, meta = _read_from_xml(xml_path)
-                with contextlib.redirect_stderr(_ESS_NULL):
-                    expected = codes_get(gid, 'numberOfDataPoints')
-                if values.size != expected:
-                    raise ValueError(f"Value count mismatch for msg {msg_index}: got {values.size}, expected {expected}.")
+def _encode_message(msg: bytes, msg_index: int, values: np.ndarray, meta: dict, packing_mode: str,
+                    validate: bool = False) -> bytes:
+    """Rebuild the source message, apply the XML values/representation, and return the encoded bytes.
+    With ``validate``, the encoded handle's totalLength is read back and any ecCodes error is raised.
+    """
+    # stderr is already silenced by the caller (worker initializer or silenced_stderr).
+    # The handle is private to this call, so it is edited in place rather than cloned first.
+    gid = codes_new_from_message(msg)
+    try:
+        expected = codes_get(gid, 'numberOfDataPoints')
+        if values.size != expected:
+            raise ValueError(f"Value count mismatch for msg {msg_index}: got {values.size}, expected {expected}.")
+
+        # Missing value handling (read before any key below is changed)
+        try:
+            msg_missing = codes_get(gid, 'missingValue')
+        except Exception:
+            msg_missing = float('nan')
 
-                # Missing value handling
-                try:
-                    msg_missing = codes_get(gid, 'missingValue')
-                except Exception:
-                    msg_missing = float('nan')
-
-                if values.dtype != np.float64:
-                    values = values.astype(np.float64, copy=False)
-
-                if np.isnan(values).any():
-                    if packing_mode == 'original':
-                        if not (isinstance(msg_missing, float) and np.isnan(msg_missing)):
-                            values = np.where(np.isnan(values), msg_missing, values)
-                            try:
-                                if codes_is_defined(clone_id, 'bitmapPresent'):
-                                    codes_set(clone_id, 'bitmapPresent', 1)
-                            except Exception:
-                                pass
-                    else:
-                        # IEEE modes preserve NaNs
+        # Optional IEEE packing for exact decoded values
+        force_ieee = (packing_mode in ('ieee32', 'ieee64'))
+        if force_ieee:
+            try:
+                codes_set(gid, 'packingType', 'grid_ieee')
+            except Exception:
+                pass
+            try:
+                # precision: 1 -> 32-bit, 2 -> 64-bit
+                codes_set(gid, 'precision', 1 if packing_mode == 'ieee32' else 2)
+            except Exception:
+                pass
+
+        # one NaN scan; the fill happens in place on the freshly parsed array
+        nan_mask = np.isnan(values)
+        if nan_mask.any():
+            if packing_mode == 'original':
+                if not (isinstance(msg_missing, float) and np.isnan(msg_missing)):
+                    np.copyto(values, msg_missing, where=nan_mask)
+                    try:
+                        if codes_is_defined(gid, 'bitmapPresent'):
+                            codes_set(gid, 'bitmapPresent', 1)
+                    except Exception:
                         pass
+            else:
+                # IEEE modes preserve NaNs
+                pass
 
-                # In original mode, prefer representation from XML, then fall back to source gid
-                if packing_mode == 'original':
-                    with contextlib.redirect_stderr(_ESS_NULL):
-                        # Prefer meta from XML when present (strict order to avoid ecCodes re-scaling)
+        # In original mode, prefer representation from XML, then fall back to source gid
+        if packing_mode == 'original':
+            # Prefer meta from XML when present (strict order to avoid ecCodes re-scaling)
+            try:
+                # 1) Base template & packing type
+                if meta.get('packingType'):
+                    codes_set(gid, 'packingType', meta['packingType'])
+                if meta.get('dataRepresentationTemplateNumber') is not None:
+                    codes_set(gid, 'dataRepresentationTemplateNumber', meta['dataRepresentationTemplateNumber'])
+
+                # 2) Scalar section-5 knobs FIRST
+                for k in ('bitsPerValue', 'binaryScaleFactor', 'decimalScaleFactor'):
+                    if meta.get(k) is not None:
+                        codes_set(gid, k, meta[k])
+
+                # 3) Floats via hex-preferred
+                for k in ('referenceValue', 'missingValue', 'secondaryMissingValue'):
+                    hex_str = meta.get(k + 'Hex')
+                    if hex_str:
                         try:
-                            # 1) Base template & packing type
-                            if meta.get('packingType'):
-                                codes_set(clone_id, 'packingType', meta['packingType'])
-                            if meta.get('dataRepresentationTemplateNumber') is not None:
-                                codes_set(clone_id, 'dataRepresentationTemplateNumber', meta['dataRepresentationTemplateNumber'])
-
-                            # 2) Scalar section-5 knobs FIRST
-                            for k in ('bitsPerValue', 'binaryScaleFactor', 'decimalScaleFactor'):
-                                if meta.get(k) is not None:
-                                    codes_set(clone_id, k, meta[k])
-
-                            # 3) Floats via hex-preferred
-                            ref_hex = meta.get('referenceValueHex')
-                            if ref_hex:
-                                try:
-                                    rv = np.frombuffer(bytes.fromhex(ref_hex), dtype='>f4')[0]
-                                    codes_set(clone_id, 'referenceValue', float(rv))
-                                except Exception:
-                                    if meta.get('referenceValue') is not None:
-                                        codes_set(clone_id, 'referenceValue', meta['referenceValue'])
-                            elif meta.get('referenceValue') is not None:
-                                codes_set(clone_id, 'referenceValue', meta['referenceValue'])
-
-                            mv_hex = meta.get('missingValueHex')
-                            if mv_hex:
-                                try:
-                                    mv = np.frombuffer(bytes.fromhex(mv_hex), dtype='>f4')[0]
-                                    codes_set(clone_id, 'missingValue', float(mv))
-                                except Exception:
-                                    if meta.get('missingValue') is not None:
-                                        codes_set(clone_id, 'missingValue', meta['missingValue'])
-                            elif meta.get('missingValue') is not None:
-                                codes_set(clone_id, 'missingValue', meta['missingValue'])
-
-                            mv2_hex = meta.get('secondaryMissingValueHex')
-                            if mv2_hex:
-                                try:
-                                    mv2 = np.frombuffer(bytes.fromhex(mv2_hex), dtype='>f4')[0]
-                                    codes_set(clone_id, 'secondaryMissingValue', float(mv2))
-                                except Exception:
-                                    if meta.get('secondaryMissingValue') is not None:
-                                        codes_set(clone_id, 'secondaryMissingValue', meta['secondaryMissingValue'])
-                            elif meta.get('secondaryMissingValue') is not None:
-                                codes_set(clone_id, 'secondaryMissingValue', meta['secondaryMissingValue'])
-
-                            # 4) Restore full Section 5 namespace keys/arrays (group/diff metadata)
-                            rk = meta.get('repr_keys') or {}
-                            ra = meta.get('repr_arrays') or {}
-                            for name, val in rk.items():
-                                try:
-                                    codes_set(clone_id, name, val)
-                                except Exception:
-                                    pass
-                            for name, arr in ra.items():
-                                try:
-                                    codes_set_array(clone_id, name, arr)
-                                except Exception:
-                                    pass
-
-                            # 5) Now set coded integer stream (avoid re-quantization)
-                            coded_vals = meta.get('codedValues')
-                            if coded_vals:
-                                try:
-                                    codes_set_array(clone_id, 'codedValues', coded_vals)
-                                    values = None  # skip decoded values later
-                                except Exception:
-                                    pass
-
-                            # 6) Keep packing as-is
-                            try:
-                                codes_set(clone_id, 'useOriginalPacking', 1)
-                            except Exception:
-                                pass
+                            codes_set(gid, k, _f4_from_hex(hex_str))
                         except Exception:
-                            pass
-                        # Fallback to original gid knobs
-                        for k in (
-                            'packingType',
-                            'dataRepresentationTemplateNumber',
-                            'bitsPerValue',
-                            'binaryScaleFactor',
-                            'decimalScaleFactor',
-                            'referenceValue',
-                        ):
-                            try:
-                                if not codes_is_defined(clone_id, k):
-                                    v = codes_get(gid, k)
-                                    codes_set(clone_id, k, v)
-                            except Exception:
-                                pass
-
-                # Write values
-                with contextlib.redirect_stderr(_ESS_NULL):
-                    if values is not None:
-                        codes_set_values(clone_id, values)
-                    codes_write(clone_id, fout)
-                reconstructed += 1
-
-                # Non-fatal check
+                            if meta.get(k) is not None:
+                                codes_set(gid, k, meta[k])
+                    elif meta.get(k) is not None:
+                        codes_set(gid, k, meta[k])
+
+                # 4) Restore full Section 5 namespace keys/arrays (group/diff metadata)
+                rk = meta.get('repr_keys') or {}
+                ra = meta.get('repr_arrays') or {}
+                for name, val in rk.items():
+                    try:
+                        codes_set(gid, name, val)
+                    except Exception:
+                        pass
+                for name, arr in ra.items():
+                    try:
+                        codes_set_array(gid, name, arr)
+                    except Exception:
+                        pass
+
+                # 5) Now set coded integer stream (avoid re-quantization)
+                coded_vals = meta.get('codedValues')
+                if coded_vals:
+                    try:
+                        codes_set_array(gid, 'codedValues', coded_vals)
+                        values = None  # skip decoded values later
+                    except Exception:
+                        pass
+
+                # 6) Keep packing as-is
                 try:
-                    with contextlib.redirect_stderr(_ESS_NULL):
-                        _ = codes_get(clone_id, 'totalLength')
+                    codes_set(gid, 'useOriginalPacking', 1)
                 except Exception:
                     pass
-
-            finally:
+            except Exception:
+                pass
+            # Fallback to original knobs; the untouched original is only rebuilt if one is undefined
+            undefined = []
+            for k in (
+                'packingType',
+                'dataRepresentationTemplateNumber',
+                'bitsPerValue',
+                'binaryScaleFactor',
+                'decimalScaleFactor',
+                'referenceValue',
+            ):
                 try:
-                    codes_release(clone_id)
+                    if not codes_is_defined(gid, k):
+                        undefined.append(k)
                 except Exception:
                     pass
-                codes_release(gid)
-            msg_index += 1
+            if undefined:
+                orig_gid = codes_new_from_message(msg)
+                try:
+                    for k in undefined:
+                        try:
+                            codes_set(gid, k, codes_get(orig_gid, k))
+                        except Exception:
+                            pass
+                finally:
+                    codes_release(orig_gid)
+
+        # Write values
+        if values is not None:
+            # C-contiguous float64 is handed to ecCodes by pointer; a no-op for arrays from _xml_values
+            codes_set_values(gid, np.ascontiguousarray(values, dtype=np.float64))
+        out = codes_get_message(gid)
+
+        # Opt-in check: costs another traversal of the encoded message, so it is off by default
+        if validate:
+            codes_get(gid, 'totalLength')
+    finally:
+        codes_release(gid)
+    return out
+
+
+def decode_xml_to_grib(original_grb_path: Path, reconstructed_grb_path: Path, xml_prefix: str, packing_mode: str = 'original',
+                       workers: int | None = None, validate: bool = False) -> None:
+    """Messages are rebuilt independently, so they are sharded across ``workers`` processes
+    (default: one per CPU; ``workers=1`` runs in-process) and written back in file order.
+    ``validate`` reads each encoded message's totalLength back to surface ecCodes errors early.
+    """
+    reconstructed_grb_path.parent.mkdir(parents=True, exist_ok=True)
 
-    print(f"Reconstruction summary: {reconstructed} messages from XML.")
+    # Source messages are read lazily from the mapped input and only a bounded window is in
+    # flight, so the parent holds a few messages at a time rather than the whole file;
+    # results are written in file order as the head of the window completes.
+    n = 0
+    pending = collections.deque()
+    with open(original_grb_path, 'rb') as fin, open(reconstructed_grb_path, 'wb') as fout:
+        if workers == 1:
+            # XML parsing (lxml/NumPy, GIL released) for the next messages overlaps encoding of the
+            # current one; ecCodes itself stays on this thread
+            def finish(msg_index, msg, fut):
+                values, meta = fut.result()
+                fout.write(_encode_message(msg, msg_index, values, meta, packing_mode, validate))
+
+            with silenced_stderr(), ThreadPoolExecutor(max_workers=2) as io_pool:
+                for n, msg in enumerate(iter_messages(fin), 1):
+                    pending.append((n - 1, msg, io_pool.submit(_load_xml, n - 1, xml_prefix)))
+                    if len(pending) > 2:
+                        finish(*pending.popleft())
+                while pending:
+                    finish(*pending.popleft())
+        else:
+            window = 2 * (workers or os.cpu_count() or 1)
+            # workers silence fd 2 once at start-up instead of per message or per call
+            with ProcessPoolExecutor(max_workers=workers, initializer=silence_stderr) as ex:
+                for n, msg in enumerate(iter_messages(fin), 1):
+                    pending.append(ex.submit(_reconstruct_message, msg, n - 1, xml_prefix, packing_mode, validate))
+                    if len(pending) >= window:
+                        fout.write(pending.popleft().result())
+                while pending:
+                    fout.write(pending.popleft().result())
+
+    print(f"Reconstruction summary: {n} messages from XML.")
 
 
 if __name__ == '__main__':
@@ -346,6 +372,10 @@ if __name__ == '__main__':
                         help='XML filename prefix(es). If omitted, uses each input stem.')
     parser.add_argument('--packing', dest='packing', choices=['original', 'ieee32', 'ieee64'], default='original',
                         help='How to pack reconstructed fields: original (default), ieee32, or ieee64.')
+    parser.add_argument('--workers', dest='workers', type=int, default=None,
+                        help='Worker processes per file (default: CPU count; 1 disables multiprocessing).')
+    parser.add_argument('--validate', action='store_true',
+                        help='Read back each encoded message to surface ecCodes errors (slower).')
     args = parser.parse_args()
 
     inputs = args.in_grb or [DATA_DIR / 'small_subset_500mb.grb2']
@@ -365,4 +395,4 @@ if __name__ == '__main__':
         prefixes.append(pref)
 
     for in_path, out_path, pref in zip(inputs, out_paths, prefixes):
-        decode_xml_to_grib(in_path, out_path, pref, args.packing)
\ No newline at end of file
+        decode_xml_to_grib(in_path, out_path, pref, args.packing, args.workers, args.validate)
\ No newline at end of file
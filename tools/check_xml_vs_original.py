@@ -7,22 +7,16 @@ from pathlib import Path
 import numpy as np
 from eccodes import *
 
+# shared GRIB scanner and XML values reader live in the package; tools/ is not on its import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+from weather._grib_messages import iter_messages
+from weather._xml_values import read_values
+
 def read_xml_values(xml_path: Path):
-    import xml.etree.ElementTree as ET
-    root = ET.parse(str(xml_path)).getroot()
-    node = root.find('variable/values') or root.find('.//values')
-    if node is None:
-        raise SystemExit(f"No <values> in {xml_path}")
-    text = (node.text or '').strip()
-    if text:
-        toks = [t for line in text.splitlines() for t in line.replace(',', ' ').split()]
-    else:
-        toks = [(ch.text or '').strip() for ch in list(node) if ch.tag.lower() == 'value']
-    def f(tok):
-        t = tok.strip()
-        if t in {'--', 'NaN', 'nan', ''}: return np.nan
-        return float(t)
-    return np.fromiter((f(t) for t in toks), dtype=np.float64)
+    try:
+        return read_values(xml_path)
+    except ValueError as e:
+        raise SystemExit(str(e))
 
 if len(sys.argv) not in (3,4):
     print(f"Usage: {Path(sys.argv[0]).name} <original.grb2> <xml_prefix> [msg_index]")
@@ -33,21 +27,23 @@ prefix   = sys.argv[2]
 msg_idx  = int(sys.argv[3]) if len(sys.argv)==4 else 0
 xml_path = Path('output_xml') / f"{prefix}_msg_{msg_idx}.xml"
 
-fo = open(grb_path, 'rb')
-for i in range(msg_idx+1):
-    gid = codes_grib_new_from_file(fo)
-    if gid is None:
-        print(f"Original has fewer than {msg_idx+1} messages.")
-        sys.exit(2)
+# earlier messages are skipped by their section-0 length, undecoded; only the target gets a handle
+with open(grb_path, 'rb') as fo:
+    msg = next(iter_messages(fo, msg_idx), None)
+if msg is None:
+    print(f"Original has fewer than {msg_idx+1} messages.")
+    sys.exit(2)
+gid = codes_new_from_message(msg)
 
-vals = np.array(codes_get_values(gid), dtype=np.float64)
-codes_release(gid); fo.close()
+vals = np.asarray(codes_get_values(gid), dtype=np.float64)  # already a fresh float64 array: no copy
+codes_release(gid)
 
 xvals = read_xml_values(xml_path)
 if vals.size != xvals.size:
     print(f"Count mismatch: GRIB {vals.size} vs XML {xvals.size}")
     sys.exit(3)
 
-diff = np.abs(vals - xvals)
-maxd = np.nanmax(diff)
+# vals is ours to overwrite: subtract and abs in place, so no temporary the size of the field
+diff = np.subtract(vals, xvals, out=vals)
+maxd = np.nanmax(np.abs(diff, out=diff))
 print(f"Msg {msg_idx}: max abs diff (original vs XML) = {maxd}")
\ No newline at end of file